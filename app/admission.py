@@ -0,0 +1,194 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from starlette.requests import Request
+
+from . import auth
+
+# Admission Control
+# Limits are per worker process: with N workers the node admits N times these.
+UPLOAD_RATE_PER_MINUTE = float(os.getenv("UPLOAD_RATE_PER_MINUTE", "6"))
+UPLOAD_BURST = int(os.getenv("UPLOAD_BURST", "3"))
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "2"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "8"))
+INFERENCE_QUEUE_BUDGET_SECONDS = float(os.getenv("INFERENCE_QUEUE_BUDGET_SECONDS", "5"))
+
+MAX_BUCKETS = 10000  # prune idle buckets beyond this many tracked clients
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.updated = time.monotonic()
+
+class RateLimiter:
+    # One token bucket per client: `burst` requests back to back, refilled
+    # at `rate_per_minute`. Only touched from the event loop, so no locking.
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.buckets = {}
+
+    def allow(self, key):
+        # Returns (allowed, retry_after_seconds)
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_BUCKETS:
+                self._prune(now)
+            bucket = self.buckets[key] = TokenBucket(self.burst)
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True, 0.0
+        return False, (1 - bucket.tokens) / self.rate
+
+    def _prune(self, now):
+        # A bucket that would have refilled completely carries no state
+        full_after = self.burst / self.rate
+        for key in [k for k, b in self.buckets.items() if now - b.updated >= full_after]:
+            del self.buckets[key]
+
+class AdmissionMetrics:
+    def __init__(self, window=1000):
+        self.admitted = Counter()  # route -> count
+        self.rejected = Counter()  # (route, reason) -> count
+        self.queue_wait_ms = deque(maxlen=window)
+
+    def admit(self, route):
+        self.admitted[route] += 1
+
+    def reject(self, route, reason):
+        self.rejected[(route, reason)] += 1
+
+    def snapshot(self):
+        waits = sorted(self.queue_wait_ms)
+        def percentile(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 2) if waits else None
+        return {
+            "admitted": dict(self.admitted),
+            "rejected": {f"{route} {reason}": count for (route, reason), count in self.rejected.items()},
+            "queue_wait_p50_ms": percentile(0.50),
+            "queue_wait_p95_ms": percentile(0.95),
+        }
+
+metrics = AdmissionMetrics()
+
+class InferenceLimiter:
+    # Caps concurrent inferences per worker. Requests wait for a slot at most
+    # `queue_budget` seconds; past that (or with too many already waiting)
+    # they get a 503, since a late answer is worse than a fast retry.
+    def __init__(self, concurrency: int, max_queue: int, queue_budget: float):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_budget = queue_budget
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+
+    def saturated(self):
+        return self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self, route="inference"):
+        if self.saturated():
+            metrics.reject(route, "queue_full")
+            raise overloaded()
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_budget)
+        except asyncio.TimeoutError:
+            metrics.reject(route, "queue_timeout")
+            raise overloaded()
+        finally:
+            self.waiting -= 1
+        metrics.queue_wait_ms.append((time.monotonic() - started) * 1000)
+        # Counted here, not in the middleware: a request the middleware let
+        # through can still time out in the queue, and must not show up as
+        # both admitted and rejected
+        metrics.admit(route)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def state(self):
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "queue_budget_seconds": self.queue_budget,
+        }
+
+inference = InferenceLimiter(INFERENCE_CONCURRENCY, INFERENCE_MAX_QUEUE, INFERENCE_QUEUE_BUDGET_SECONDS)
+
+def overloaded():
+    return HTTPException(status_code=503, detail="Server busy, please retry shortly",
+                         headers={"Retry-After": str(math.ceil(INFERENCE_QUEUE_BUDGET_SECONDS))})
+
+# (method, path) -> rate limiter; routes listed in INFERENCE_ROUTES are also
+# shed up front while the inference queue is full.
+ROUTE_LIMITS = {
+    ("POST", "/patient/upload"): RateLimiter(UPLOAD_RATE_PER_MINUTE, UPLOAD_BURST),
+}
+INFERENCE_ROUTES = {"/patient/upload"}
+
+def client_key(request: Request) -> str:
+    # Per user when the token is valid (signature only, no DB hit), else per IP
+    token = request.cookies.get("access_token") or request.headers.get("Authorization", "")
+    token = token.strip('"')
+    if token.startswith("Bearer "):
+        token = token.split(" ", 1)[1]
+    if token:
+        try:
+            username = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("sub")
+            if username:
+                return f"user:{username}"
+        except JWTError:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+class AdmissionMiddleware:
+    # Plain ASGI middleware: it decides from the headers alone, so rejected
+    # uploads are answered before a single byte of the body is read.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        limiter = ROUTE_LIMITS.get((scope["method"], path))
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        allowed, retry_after = limiter.allow(client_key(Request(scope)))
+        if not allowed:
+            metrics.reject(path, "rate_limited")
+            response = JSONResponse(status_code=429, content={"detail": "Too many requests"},
+                                    headers={"Retry-After": str(math.ceil(retry_after))})
+            return await response(scope, receive, send)
+
+        if path in INFERENCE_ROUTES and inference.saturated():
+            metrics.reject(path, "queue_full")
+            response = JSONResponse(status_code=503, content={"detail": "Server busy, please retry shortly"},
+                                    headers={"Retry-After": str(math.ceil(INFERENCE_QUEUE_BUDGET_SECONDS))})
+            return await response(scope, receive, send)
+
+        if path not in INFERENCE_ROUTES:
+            # Inference routes are counted once they get a slot (InferenceLimiter.slot)
+            metrics.admit(path)
+        await self.app(scope, receive, send)
@@ -0,0 +1,267 @@
+import fcntl
+import os
+import re
+import threading
+
+import numpy as np
+
+# Embedding Index
+# One float16 row per prediction id (row i = Prediction.id i) in a memory-mapped
+# file, L2-normalized so cosine similarity is a plain dot product. 2048-d ResNet50
+# features cost 4 KB per case: 1M cases is a 4 GB file the OS pages in on demand.
+# Each model version gets its own index under EMBEDDING_DIR: features from two
+# different weight files live in different spaces and must never be compared.
+IS_VERCEL = os.environ.get("VERCEL") == "1"
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "/tmp/embeddings" if IS_VERCEL else "./embeddings")
+EMBEDDING_DIM = 2048
+GROW_ROWS = 65536  # file grows in steps of this many rows
+# Rows scored per matmul. Each chunk is converted to a float32 temporary
+# (SEARCH_CHUNK x dim x 4 B = 32 MB), so this bounds per-request memory.
+# Exact search still reads every row: ~1 s at 256k rows, hence IVF by default.
+SEARCH_CHUNK = 4096
+
+class EmbeddingIndex:
+    def __init__(self, directory: str = EMBEDDING_DIR, dim: int = EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.present_path = os.path.join(directory, "present.u8")
+        self.lists_path = os.path.join(directory, "ivf_lists.i32")
+        self.centroids_path = os.path.join(directory, "ivf_centroids.npy")
+        self.lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.Lock()
+        self._capacity = 0
+        self.vectors = None  # (capacity, dim) float16
+        self.present = None  # (capacity,) uint8, 1 = row holds an embedding
+        self.lists = None  # (capacity,) int32, IVF list per row, -1 = unassigned
+        self.centroids = None  # (nlist, dim) float32, None until build_ivf()
+        self._centroids_mtime = None
+
+    # --- Storage ---
+
+    def _file_rows(self):
+        try:
+            return os.path.getsize(self.present_path)
+        except OSError:
+            return 0
+
+    def _open(self):
+        # (Re)map the files; cheap, and needed whenever another worker grew them
+        rows = self._file_rows()
+        if rows == 0:
+            return
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r+", shape=(rows, self.dim))
+        self.present = np.memmap(self.present_path, dtype=np.uint8, mode="r+", shape=(rows,))
+        self.lists = np.memmap(self.lists_path, dtype=np.int32, mode="r+", shape=(rows,))
+        self._capacity = rows
+        self._load_centroids()
+
+    def _refresh(self):
+        # Called before every read and write: picks up files grown by another
+        # worker and an IVF index (re)built by `python -m app.embeddings`, so
+        # no worker searches or assigns lists with stale centroids.
+        if self._file_rows() != self._capacity:
+            self._open()
+        else:
+            self._load_centroids()
+
+    def _grow(self, min_rows):
+        os.makedirs(self.directory, exist_ok=True)
+        # Several workers may grow the files at once; the file lock serializes it
+        with open(self.lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            rows = self._file_rows()
+            if rows < min_rows:
+                new_rows = -(-min_rows // GROW_ROWS) * GROW_ROWS
+                # Extending with truncate leaves sparse zero-filled space
+                with open(self.vectors_path, "ab") as f:
+                    f.truncate(new_rows * self.dim * 2)
+                with open(self.present_path, "ab") as f:
+                    f.truncate(new_rows)
+                with open(self.lists_path, "ab") as f:
+                    old = os.path.getsize(self.lists_path) // 4
+                    f.truncate(new_rows * 4)
+                # New IVF slots start unassigned (-1), not list 0
+                lists = np.memmap(self.lists_path, dtype=np.int32, mode="r+", shape=(new_rows,))
+                lists[old:] = -1
+                lists.flush()
+                del lists
+        self._open()
+
+    def _load_centroids(self):
+        try:
+            mtime = os.stat(self.centroids_path).st_mtime_ns
+        except OSError:
+            self.centroids = None
+            return
+        if mtime != self._centroids_mtime:
+            self.centroids = np.load(self.centroids_path)
+            self._centroids_mtime = mtime
+
+    # --- Writes ---
+
+    def add(self, prediction_id: int, embedding):
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return
+        vec = vec / norm
+        with self._lock:
+            self._refresh()
+            if prediction_id >= self._capacity:
+                self._grow(prediction_id + 1)
+            self.vectors[prediction_id] = vec.astype(np.float16)
+            if self.centroids is not None:
+                self.lists[prediction_id] = int(np.argmax(self.centroids @ vec))
+            self.present[prediction_id] = 1
+
+    def remove(self, prediction_id: int):
+        with self._lock:
+            self._refresh()
+            if prediction_id < self._capacity:
+                self.present[prediction_id] = 0
+
+    def _snapshot(self):
+        # Callers run in threadpool threads. _open() rebinds the memmaps rather
+        # than mutating them, so references taken under the lock stay valid for
+        # a whole search while other threads add rows or grow the files.
+        with self._lock:
+            self._refresh()
+            return self._capacity, self.vectors, self.present, self.lists, self.centroids
+
+    # --- Search ---
+
+    def get(self, prediction_id: int):
+        capacity, vectors, present, _, _ = self._snapshot()
+        if prediction_id >= capacity or not present[prediction_id]:
+            return None
+        return np.asarray(vectors[prediction_id], dtype=np.float32)
+
+    def search(self, query, k: int = 5, exclude_id=None, approximate: bool = None, nprobe: int = 8):
+        # Returns [(prediction_id, cosine_similarity), ...], best first.
+        # approximate=None uses the IVF index when one has been built.
+        capacity, vectors, present, lists, centroids = self._snapshot()
+        if capacity == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        if approximate is None:
+            approximate = centroids is not None
+        if approximate and centroids is None:
+            print(f"WARNING: No IVF index in {self.directory}, falling back to exact search. "
+                  "Build one with: python -m app.embeddings <model_version>")
+        if approximate and centroids is not None:
+            rows = self._ivf_candidates(query, nprobe, centroids, lists, present)
+        else:
+            rows = None
+
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        total = capacity if rows is None else len(rows)
+        for start in range(0, total, SEARCH_CHUNK):
+            if rows is None:
+                mask = present[start:start + SEARCH_CHUNK].astype(bool)
+                if not mask.any():
+                    # Ids are global, so an older version's index is mostly
+                    # empty rows; don't page in vectors nobody wrote
+                    continue
+                ids = np.arange(start, min(start + SEARCH_CHUNK, total))
+                block = vectors[start:start + SEARCH_CHUNK]
+            else:
+                ids = rows[start:start + SEARCH_CHUNK]
+                block = vectors[ids]
+                mask = np.ones(len(ids), dtype=bool)
+            scores = block.astype(np.float32) @ query
+            scores[~mask] = -np.inf
+            if exclude_id is not None:
+                scores[ids == exclude_id] = -np.inf
+            # Keep a running top-k: argpartition is O(n), a full sort is not
+            keep = min(k, len(scores))
+            top = np.argpartition(-scores, keep - 1)[:keep]
+            best_ids = np.concatenate([best_ids, ids[top]])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_ids) > k:
+                top = np.argpartition(-best_scores, k - 1)[:k]
+                best_ids, best_scores = best_ids[top], best_scores[top]
+
+        order = np.argsort(-best_scores)
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order if np.isfinite(best_scores[i])]
+
+    def _ivf_candidates(self, query, nprobe, centroids, lists, present):
+        # Rows in the nprobe lists closest to the query, plus rows added before
+        # the index was built (still unassigned) so nothing is ever unreachable.
+        probes = np.argsort(-(centroids @ query))[:nprobe]
+        lists = np.asarray(lists)
+        candidates = np.isin(lists, probes) | (lists == -1)
+        return np.flatnonzero(candidates & np.asarray(present, dtype=bool))
+
+    # --- Approximate index ---
+
+    def build_ivf(self, nlist: int = None, iterations: int = 10, sample_size: int = 65536):
+        # Spherical k-means over a sample, then every stored row is assigned to
+        # its nearest centroid. Searching nprobe of nlist lists scores roughly
+        # nprobe/nlist of the corpus instead of all of it. Safe to run while the
+        # app is serving; workers switch to the new centroids on their next call.
+        capacity, vectors, present, _, _ = self._snapshot()
+        if capacity == 0:
+            return 0
+        ids = np.flatnonzero(np.asarray(present, dtype=bool))
+        if len(ids) == 0:
+            return 0
+        nlist = nlist or max(1, int(np.sqrt(len(ids))))
+        nlist = min(nlist, len(ids))
+        rng = np.random.default_rng(0)
+        sample = vectors[np.sort(rng.choice(ids, min(sample_size, len(ids)), replace=False))].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        with self._lock:
+            self._refresh()
+            for start in range(0, len(ids), SEARCH_CHUNK):
+                chunk = ids[start:start + SEARCH_CHUNK]
+                self.lists[chunk] = np.argmax(self.vectors[chunk].astype(np.float32) @ centroids.T, axis=1)
+            self.lists.flush()
+            tmp_path = self.centroids_path + ".tmp.npy"
+            np.save(tmp_path, centroids)
+            os.replace(tmp_path, self.centroids_path)
+            self._refresh()
+            # Rows other workers added while this ran were assigned with the old
+            # centroids (or none); move them onto the new lists
+            late = np.setdiff1d(np.flatnonzero(np.asarray(self.present, dtype=bool)), ids)
+            if len(late):
+                self.lists[late] = np.argmax(self.vectors[late].astype(np.float32) @ centroids.T, axis=1)
+                self.lists.flush()
+        print(f"INFO: Built IVF index: {nlist} lists over {len(ids)} embeddings.")
+        return nlist
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def index_dir(model_version) -> str:
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", str(model_version or "unknown")).lstrip(".") or "unknown"
+    return os.path.join(EMBEDDING_DIR, name)
+
+def get_index(model_version) -> EmbeddingIndex:
+    # One index per model version, opened once per process
+    directory = index_dir(model_version)
+    with _indexes_lock:
+        if directory not in _indexes:
+            _indexes[directory] = EmbeddingIndex(directory)
+        return _indexes[directory]
+
+if __name__ == "__main__":
+    # python -m app.embeddings <model_version> [nlist]  -> (re)build that version's approximate index
+    import sys
+    if len(sys.argv) < 2:
+        versions = sorted(os.listdir(EMBEDDING_DIR)) if os.path.isdir(EMBEDDING_DIR) else []
+        print("Usage: python -m app.embeddings <model_version> [nlist]")
+        print(f"Indexed model versions: {', '.join(versions) or 'none'}")
+        sys.exit(1)
+    get_index(sys.argv[1]).build_ivf(int(sys.argv[2]) if len(sys.argv) > 2 else None)
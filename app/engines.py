@@ -0,0 +1,79 @@
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+import os
+
+import numpy as np
+
+from . import ml_utils
+
+# ONNX Runtime intra-op threads; 0 lets ORT pick (one per physical core).
+# With several workers per node, set it to cores / workers.
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+# Both engines take a preprocessed (N, 3, 224, 224) float32 batch from
+# ml_utils.preprocess() and return (logits, features) as float32 numpy arrays,
+# features being the pooled 2048-d ResNet50 vector used for similar-case search.
+
+class TorchEngine:
+    name = "torch"
+
+    def __init__(self, path):
+        if not ml_utils.TORCH_AVAILABLE:
+            raise RuntimeError("torch is not installed (use an .onnx model with onnxruntime instead)")
+        self.model = ml_utils.load_model(path)
+
+    def infer(self, batch):
+        with ml_utils.torch.no_grad():
+            logits, features = ml_utils.forward_with_features(
+                self.model, ml_utils.torch.from_numpy(batch).to(ml_utils.device))
+        return logits.float().cpu().numpy(), features.float().cpu().numpy()
+
+class OnnxEngine:
+    name = "onnx"
+
+    def __init__(self, path):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime is not installed (pip install onnxruntime)")
+        options = ort.SessionOptions()
+        # Constant folding, conv+bn fusion, layout optimizations, ...
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        print(f"SUCCESS: ONNX model {path} loaded.")
+
+    def infer(self, batch):
+        logits, features = self.session.run(["logits", "features"], {self.input_name: batch})
+        return logits, features
+
+def load_engine(path):
+    # The file decides the engine: exported .onnx graphs run on ONNX Runtime,
+    # anything else is treated as a PyTorch state dict.
+    if path.lower().endswith(".onnx"):
+        return OnnxEngine(path)
+    return TorchEngine(path)
+
+def warm_up(engine, runs=2):
+    # First runs pay for allocator growth and kernel selection;
+    # do them before the model takes real traffic.
+    dummy = np.zeros((1, 3, ml_utils.IMAGE_SIZE, ml_utils.IMAGE_SIZE), dtype=np.float32)
+    for _ in range(runs):
+        engine.infer(dummy)
+
+def softmax(logits):
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def predict(engine, batch):
+    # Returns (label, confidence, features) for a single-image batch
+    logits, features = engine.infer(batch)
+    probabilities = softmax(logits)[0]
+    label = int(np.argmax(probabilities))
+    return label, float(probabilities[label]), features[0]
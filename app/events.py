@@ -0,0 +1,129 @@
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    aioredis = None
+    REDIS_AVAILABLE = False
+
+import asyncio
+import json
+import os
+
+# In-process pub/sub by default. With several workers, point EVENT_BROKER_URL
+# at a Redis-compatible broker (a local `redis-server` is enough) so an event
+# published by one worker reaches browsers connected to any of them.
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL")
+EVENT_CHANNEL = "idc-events"
+BROKER_RETRY_MAX_SECONDS = 30
+BROKER_PUBLISH_TIMEOUT_SECONDS = 2
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscription:
+    def __init__(self, user_id: int, role: str):
+        self.user_id = user_id
+        self.role = role.lower()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event: dict) -> bool:
+        # Events are scoped: delivered to the listed users and/or whole roles
+        return self.user_id in event["user_ids"] or self.role in event["roles"]
+
+class EventBus:
+    def __init__(self):
+        self.subscriptions = set()
+        self.redis = None
+        self._listener = None
+
+    def subscribe(self, user) -> Subscription:
+        sub = Subscription(user.id, user.role)
+        self.subscriptions.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self.subscriptions.discard(sub)
+
+    async def publish(self, event_type: str, data: dict, user_ids=(), roles=()):
+        event = {
+            "type": event_type,
+            "data": data,
+            "user_ids": list(user_ids),
+            "roles": [r.lower() for r in roles],
+        }
+        if self.redis is not None:
+            try:
+                # Bounded: a hung broker must not stall the request publishing
+                await asyncio.wait_for(self.redis.publish(EVENT_CHANNEL, json.dumps(event)),
+                                       timeout=BROKER_PUBLISH_TIMEOUT_SECONDS)
+                return
+            except Exception as e:
+                print(f"ERROR: Event broker publish failed, delivering locally only: {e!r}")
+        self.dispatch(event)
+
+    def dispatch(self, event: dict):
+        for sub in list(self.subscriptions):
+            if not sub.wants(event):
+                continue
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow or stalled client: drop rather than buffer without bound.
+                # The page still has the reload fallback.
+                pass
+
+    async def start(self):
+        if not EVENT_BROKER_URL:
+            return
+        if not REDIS_AVAILABLE:
+            print("WARNING: EVENT_BROKER_URL is set but redis is not installed. Using in-process events.")
+            return
+        self.redis = aioredis.from_url(EVENT_BROKER_URL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        # Runs for the life of the worker. If the broker connection drops, log
+        # it and resubscribe with backoff; otherwise publish() would keep
+        # succeeding while this worker's browsers silently stop getting events.
+        delay = 1
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(EVENT_CHANNEL)
+                print(f"INFO: Event broker subscribed: {EVENT_BROKER_URL}")
+                delay = 1
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self.dispatch(json.loads(message["data"]))
+                    except ValueError as e:
+                        print(f"ERROR: Bad event from broker: {e}")
+                print("ERROR: Event broker subscription ended.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Event broker connection lost: {e}")
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            print(f"INFO: Reconnecting to event broker in {delay}s.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BROKER_RETRY_MAX_SECONDS)
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        if self.redis is not None:
+            await self.redis.close()
+
+bus = EventBus()
+
+def prediction_payload(prediction) -> dict:
+    return {
+        "id": prediction.id,
+        "user_id": prediction.user_id,
+        "result_class": prediction.result_class,
+        "confidence": prediction.confidence,
+        "status": prediction.status,
+    }
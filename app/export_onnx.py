@@ -0,0 +1,104 @@
+"""Export the PyTorch checkpoint to ONNX and check the two engines agree.
+
+    python -m app.export_onnx                       # export + parity check on synthetic patches
+    python -m app.export_onnx --check a.png b.png   # parity check on real sample images
+
+Needs torch (export side) and onnxruntime (check side); serving the exported
+model only needs onnxruntime. Exits non-zero if the engines disagree.
+"""
+import argparse
+import inspect
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+from . import ml_utils, engines
+
+OPSET = 18
+MAX_PROB_DIFF = 1e-3  # fp32 reordering noise is ~1e-5; anything near 1e-3 is a real bug
+MIN_FEATURE_COSINE = 0.999
+
+def export(checkpoint, output):
+    torch = ml_utils.torch
+    net = ml_utils.load_model(checkpoint).cpu()
+
+    class WithFeatures(torch.nn.Module):
+        # Exports both heads used at serving time: logits and pooled features
+        def __init__(self, net):
+            super().__init__()
+            self.net = net
+
+        def forward(self, x):
+            return ml_utils.forward_with_features(self.net, x)
+
+    dummy = torch.zeros(1, 3, ml_utils.IMAGE_SIZE, ml_utils.IMAGE_SIZE)
+    # One self-contained file (~94 MB): recent exporters otherwise write the
+    # weights to a separate <output>.data file that the .onnx can't load without.
+    # Older torch has no such argument and always embeds models under 2 GB.
+    extra = {}
+    if "external_data" in inspect.signature(torch.onnx.export).parameters:
+        extra["external_data"] = False
+    torch.onnx.export(
+        WithFeatures(net).eval(), dummy, output,
+        input_names=["input"],
+        output_names=["logits", "features"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}, "features": {0: "batch"}},
+        opset_version=OPSET,
+        **extra,
+    )
+    size_mb = os.path.getsize(output) / 1e6
+    print(f"SUCCESS: Exported {checkpoint} -> {output} ({size_mb:.0f} MB, opset {OPSET}).")
+
+def synthetic_images(count=8, seed=0):
+    # Random RGB noise at the dataset's 50x50 patch size, PNG-encoded like uploads
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (50, 50, 3), dtype=np.uint8)).save(buffer, format="PNG")
+        yield buffer.getvalue()
+
+def check_parity(checkpoint, onnx_path, images):
+    torch_engine = engines.TorchEngine(checkpoint)
+    onnx_engine = engines.OnnxEngine(onnx_path)
+    ok = True
+    for i, image_bytes in enumerate(images):
+        batch = ml_utils.preprocess(image_bytes)
+        t_logits, t_features = torch_engine.infer(batch)
+        o_logits, o_features = onnx_engine.infer(batch)
+        prob_diff = float(np.abs(engines.softmax(t_logits) - engines.softmax(o_logits)).max())
+        cosine = float(np.dot(t_features[0], o_features[0]) /
+                       max(np.linalg.norm(t_features[0]) * np.linalg.norm(o_features[0]), 1e-12))
+        same_label = int(t_logits.argmax()) == int(o_logits.argmax())
+        passed = same_label and prob_diff <= MAX_PROB_DIFF and cosine >= MIN_FEATURE_COSINE
+        ok = ok and passed
+        print(f"{'OK  ' if passed else 'FAIL'} image {i}: label match={same_label} "
+              f"max prob diff={prob_diff:.2e} feature cosine={cosine:.6f}")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the IDC ResNet50 checkpoint to ONNX.")
+    parser.add_argument("--checkpoint", default=ml_utils.DEFAULT_MODEL_PATHS["torch"])
+    parser.add_argument("--output", default=ml_utils.DEFAULT_MODEL_PATHS["onnx"])
+    parser.add_argument("--check", nargs="*", metavar="IMAGE",
+                        help="skip export; compare engines on these images (synthetic patches if none)")
+    args = parser.parse_args(argv)
+
+    if args.check is None:
+        export(args.checkpoint, args.output)
+        images = list(synthetic_images())
+    elif args.check:
+        images = [open(path, "rb").read() for path in args.check]
+    else:
+        images = list(synthetic_images())
+
+    if not check_parity(args.checkpoint, args.output, images):
+        print("ERROR: ONNX and PyTorch outputs differ.")
+        return 1
+    print(f"SUCCESS: ONNX matches PyTorch on {len(images)} images.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,25 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
-from .database import engine, Base
-from .routers import auth, patient, pathologist
+import os
+from .database import engine, Base, add_missing_columns
+from .routers import auth, patient, pathologist, admin, events
+from . import ml_utils, storage
+from .events import bus
+from .admission import AdmissionMiddleware
 
 # Create DB Tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 app = FastAPI(title="IDC Detect Portal", debug=True)
 
+# Pre-fork model loading: with PRELOAD_MODEL=1 the weights are loaded at import
+# time, so `gunicorn --preload` loads them once in the master and the forked
+# workers share those pages copy-on-write (see gunicorn.conf.py).
+if os.getenv("PRELOAD_MODEL") == "1":
+    ml_utils.get_model()
+
 @app.on_event("startup")
 async def startup_event():
     # Diagnostics for DB persistence on Vercel
@@ -23,14 +34,33 @@ async def startup_event():
         print(f"STARTUP: DB connection test FAILED: {e}")
     finally:
         db.close()
+    ml_utils.log_memory_usage("worker startup")
+    # Per-worker thread: started after fork, never in the preloading master
+    from .model_registry import registry
+    registry.start_manifest_watcher()
+    await bus.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await bus.stop()
+
+# Shed over-limit uploads before their body is read (see admission.py)
+app.add_middleware(AdmissionMiddleware)
 
 # Mount Static Files
 app.mount("/static", StaticFiles(directory="static"), name="static")
+# Uploads stored outside static/ (UPLOAD_DIR) get their own mount
+upload_mount = storage.upload_mount()
+if upload_mount:
+    os.makedirs(upload_mount[1], exist_ok=True)
+    app.mount(upload_mount[0], StaticFiles(directory=upload_mount[1]), name="uploads")
 
 # Include Routers
 app.include_router(auth.router)
 app.include_router(patient.router)
 app.include_router(pathologist.router)
+app.include_router(admin.router)
+app.include_router(events.router)
 
 @app.get("/")
 async def root():
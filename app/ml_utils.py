@@ -1,101 +1,134 @@
 try:
     import torch
     import torch.nn as nn
-    from torchvision import models, transforms
+    from torchvision import models
     TORCH_AVAILABLE = True
 except ImportError:
     torch = None
     nn = None
     models = None
-    transforms = None
     TORCH_AVAILABLE = False
 
+import numpy as np
 from PIL import Image
 import io
 import os
-import random
 
-# Load Model
-MODEL_PATH = "breast_idc_resnet50_best_state_dict.pth"
+# Inference engine for the default model: "torch" (eager PyTorch) or "onnx"
+# (ONNX Runtime, CPU; export with `python -m app.export_onnx`). Registry versions
+# pick their engine from the file extension, see engines.load_engine().
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "torch").lower()
+
+# Load Model (default version served when no registry manifest says otherwise)
+DEFAULT_MODEL_PATHS = {
+    "torch": "breast_idc_resnet50_best_state_dict.pth",
+    "onnx": "breast_idc_resnet50_best.onnx",
+}
+MODEL_PATH = os.getenv("MODEL_PATH", DEFAULT_MODEL_PATHS.get(INFERENCE_ENGINE, DEFAULT_MODEL_PATHS["torch"]))
+MODEL_VERSION = os.getenv("MODEL_VERSION") or os.path.splitext(os.path.basename(MODEL_PATH))[0]
+
+# Memory-mapped weight loading (shared read-only pages across workers)
+# Set MODEL_MMAP=0 to fall back to a private in-memory copy per worker.
+MODEL_MMAP = os.getenv("MODEL_MMAP", "1") != "0"
 
 # Initialize device only if torch is available
 device = None
 if TORCH_AVAILABLE:
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-model = None
 DEMO_MODE = not TORCH_AVAILABLE
 
-def get_model():
-    global model, DEMO_MODE
-    if not TORCH_AVAILABLE:
-        DEMO_MODE = True
-        return None
-        
-    if model is not None:
-        return model
-    
-    if not os.path.exists(MODEL_PATH):
-        print(f"WARNING: Model file {MODEL_PATH} not found. Running in DEMO MODE (Random Predictions).")
-        DEMO_MODE = True
-        return None
-
+def memory_usage():
+    # Returns (rss_mb, pss_mb) for this process. PSS splits shared pages
+    # between the processes mapping them, so it shows what mmap saves per worker.
+    rss = pss = None
     try:
-        # Load Architecture
-        model = models.resnet50(weights=None) 
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) / 1024
+    except OSError:
+        pass  # Not Linux (or /proc unavailable)
+    return rss, pss
+
+def log_memory_usage(label):
+    rss, pss = memory_usage()
+    if rss is None:
+        return
+    pss_text = f"{pss:.1f} MB" if pss is not None else "n/a"
+    print(f"MEMORY [{label}] pid={os.getpid()} RSS={rss:.1f} MB PSS={pss_text}")
+
+def load_state_dict(path):
+    # mmap=True keeps tensor storages backed by the file's page cache, so every
+    # worker on the node reads the same physical pages instead of its own copy.
+    # Only possible on CPU; CUDA weights are copied to device memory anyway.
+    use_mmap = MODEL_MMAP and device.type == "cpu"
+    if use_mmap:
+        try:
+            return torch.load(path, map_location="cpu", mmap=True, weights_only=True), True
+        except Exception as e:
+            # Older torch or a legacy (non-zipfile) checkpoint
+            print(f"WARNING: mmap load unavailable ({e}). Falling back to regular load.")
+    return torch.load(path, map_location=device), False
+
+def load_model(path):
+    # Builds ResNet50 with the 2-class head and loads weights from `path`.
+    # Raises on failure; callers decide whether to fall back.
+    log_memory_usage(f"before model load ({path})")
+
+    # Load Architecture (on the meta device: no throwaway random init)
+    with torch.device("meta"):
+        net = models.resnet50(weights=None)
         # Adjust FC layer
-        num_ftrs = model.fc.in_features
-        model.fc = nn.Linear(num_ftrs, 2)
-        
-        # Load Weights
-        state_dict = torch.load(MODEL_PATH, map_location=device)
-        model.load_state_dict(state_dict)
-        
-        model.to(device)
-        model.eval()
-        print("SUCCESS: Model loaded successfully.")
-    except Exception as e:
-        print(f"ERROR: Failed to load model: {e}")
-        DEMO_MODE = True
-        return None
-        
-    return model
+        num_ftrs = net.fc.in_features
+        net.fc = nn.Linear(num_ftrs, 2)
+    
+    # Load Weights. assign=True adopts the (mmap'd) tensors as parameters
+    # instead of copying them into freshly allocated ones.
+    state_dict, mmapped = load_state_dict(path)
+    net.load_state_dict(state_dict, assign=True)
+    
+    net.to(device)
+    net.eval()
+    print(f"SUCCESS: Model {path} loaded successfully (mmap={mmapped}).")
+    log_memory_usage(f"after model load ({path})")
+    return net
 
 # Preprocessing
-if TORCH_AVAILABLE:
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-else:
-    transform = None
+# Plain PIL + NumPy so inference-only (ONNX) deployments don't need torch.
+# Matches transforms.Resize((224, 224)) + ToTensor() + Normalize(...) exactly:
+# torchvision resizes PIL images with the same bilinear filter.
+IMAGE_SIZE = 224
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+def preprocess(image_bytes):
+    # Returns a (1, 3, 224, 224) float32 batch
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+    array = (np.asarray(image, dtype=np.float32) / 255.0 - MEAN) / STD
+    return np.ascontiguousarray(array.transpose(2, 0, 1)[np.newaxis])
+
+def forward_with_features(net, x):
+    # Same as ResNet.forward, but also hands back the pooled 2048-d features
+    # that feed the fc layer (used for similar-case search) from the same pass.
+    x = net.maxpool(net.relu(net.bn1(net.conv1(x))))
+    x = net.layer4(net.layer3(net.layer2(net.layer1(x))))
+    features = torch.flatten(net.avgpool(x), 1)
+    return net.fc(features), features
+
+def get_model():
+    global DEMO_MODE
+    from .model_registry import registry
+    loaded = registry.get_active()
+    DEMO_MODE = loaded is None
+    return loaded.engine if loaded else None
 
 def predict_image(image_bytes):
-    get_model() # Ensure loaded
-    
-    if DEMO_MODE:
-        # Simulate prediction
-        print("INFO: Generating DEMO prediction.")
-        label = random.choice([0, 1])
-        confidence = random.uniform(0.70, 0.99)
-        return label, confidence
-
-    # This part only runs if TORCH_AVAILABLE and model loaded
-    try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        image_tensor = transform(image).unsqueeze(0).to(device)
-        
-        with torch.no_grad():
-            outputs = model(image_tensor)
-            probabilities = torch.nn.functional.softmax(outputs, dim=1)
-            
-            # Get class and confidence
-            top_p, top_class = probabilities.topk(1, dim=1)
-            label = top_class.item()
-            confidence = top_p.item()
-            
-            return label, confidence
-    except Exception as e:
-        print(f"Inference Error: {e}")
-        return 0, 0.0
+    # Returns (label, confidence, model_version, features or None)
+    from .model_registry import registry
+    return registry.predict(image_bytes)
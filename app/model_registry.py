@@ -0,0 +1,280 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import ml_utils, engines
+
+# Optional manifest shared by all workers on a node, e.g.
+#   {"active": {"version": "v2", "path": "weights/v2.pth"},
+#    "shadow": {"version": "v3", "path": "weights/v3.pth", "fraction": 0.1}}
+# Every worker polls it and reconciles, so a change reaches all of them
+# without a restart. Without it, changes only apply to the worker handling them.
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST")
+MANIFEST_POLL_SECONDS = float(os.getenv("MODEL_MANIFEST_POLL_SECONDS", "10"))
+
+DEMO_VERSION = "demo"
+
+class LoadedModel:
+    def __init__(self, version, path, engine):
+        self.version = version
+        self.path = path
+        self.engine = engine
+        self.loaded_at = time.time()
+
+class ShadowStats:
+    # Latency and agreement of the candidate vs the active model, measured on
+    # the same sampled requests so the two are directly comparable.
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.agreements = 0
+        self.errors = 0
+        self.dropped = 0  # sampled but skipped: a shadow run was already in progress
+        self.active_ms = deque(maxlen=window)
+        self.candidate_ms = deque(maxlen=window)
+
+    def record(self, agreed, active_ms, candidate_ms):
+        with self.lock:
+            self.samples += 1
+            self.agreements += int(agreed)
+            self.active_ms.append(active_ms)
+            self.candidate_ms.append(candidate_ms)
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def record_dropped(self):
+        with self.lock:
+            self.dropped += 1
+
+    @staticmethod
+    def _percentile(values, q):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "samples": self.samples,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "agreement": round(self.agreements / self.samples, 4) if self.samples else None,
+                "active_p50_ms": self._percentile(self.active_ms, 0.50),
+                "active_p95_ms": self._percentile(self.active_ms, 0.95),
+                "candidate_p50_ms": self._percentile(self.candidate_ms, 0.50),
+                "candidate_p95_ms": self._percentile(self.candidate_ms, 0.95),
+            }
+
+class ModelRegistry:
+    def __init__(self):
+        # Readers never take a lock: `active` / `candidate` are swapped by plain
+        # reference assignment, which is atomic, and each request reads them once.
+        self.active = None
+        self.candidate = None
+        self.shadow_fraction = 0.0
+        self.shadow_stats = ShadowStats()
+        self.status = {}  # version -> "loading" | "ready" | "failed: ..."
+        self._load_lock = threading.Lock()  # one background load at a time
+        self._default_tried = False
+        # At most one shadow run queued or running: a sample arriving while one
+        # is in flight is dropped, so shadowing never builds a backlog or takes
+        # more than one extra core outside the admission limits.
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_lock = threading.Lock()
+        self._shadow_pending = 0
+        self._manifest_mtime = None
+        self._watcher = None
+
+    # --- Loading ---
+
+    def _load(self, version, path):
+        self.status[version] = "loading"
+        try:
+            # Inside the try: a missing file must end as "failed", not stay
+            # "loading" (apply_manifest never retries a version that is loading)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Model file {path} not found")
+            engine = engines.load_engine(path)
+            engines.warm_up(engine)
+        except Exception as e:
+            self.status[version] = f"failed: {e}"
+            raise
+        self.status[version] = "ready"
+        return LoadedModel(version, path, engine)
+
+    def get_active(self):
+        # Lazily load the default MODEL_PATH on first use (the old get_model behaviour)
+        if self.active is None and not self._default_tried:
+            with self._load_lock:
+                if self.active is None and not self._default_tried:
+                    self._default_tried = True
+                    try:
+                        self.active = self._load(ml_utils.MODEL_VERSION, ml_utils.MODEL_PATH)
+                    except Exception as e:
+                        print(f"WARNING: {e}. Running in DEMO MODE (Random Predictions).")
+        return self.active
+
+    def load_in_background(self, version, path, shadow_fraction=None):
+        # Loads and warms `version` off the request path. With shadow_fraction
+        # it becomes the shadow candidate, otherwise it is swapped in as active.
+        def worker():
+            with self._load_lock:
+                try:
+                    loaded = self._load(version, path)
+                except Exception as e:
+                    print(f"ERROR: Failed to load model {version}: {e}")
+                    return
+                if shadow_fraction is None:
+                    self._swap_active(loaded)
+                else:
+                    self.shadow_stats = ShadowStats()
+                    self.candidate = loaded
+                    self.shadow_fraction = shadow_fraction
+                    print(f"INFO: Shadowing model {version} on {shadow_fraction:.0%} of traffic.")
+
+        self.status[version] = "loading"
+        thread = threading.Thread(target=worker, name=f"model-load-{version}", daemon=True)
+        thread.start()
+        return thread
+
+    def _swap_active(self, loaded):
+        previous = self.active
+        self.active = loaded
+        self._default_tried = True
+        if self.candidate is not None and self.candidate.version == loaded.version:
+            self.stop_shadow()
+        print(f"INFO: Active model swapped {previous.version if previous else None} -> {loaded.version}.")
+
+    def promote(self):
+        # Candidate already loaded and warm: promotion is just the swap
+        if self.candidate is None:
+            raise ValueError("No candidate model to promote")
+        self._swap_active(self.candidate)
+
+    def stop_shadow(self):
+        self.candidate = None
+        self.shadow_fraction = 0.0
+
+    # --- Inference ---
+
+    def predict(self, image_bytes):
+        # Returns (label, confidence, model_version, features or None)
+        active = self.get_active()
+        ml_utils.DEMO_MODE = active is None
+        if active is None:
+            # Simulate prediction
+            print("INFO: Generating DEMO prediction.")
+            return random.choice([0, 1]), random.uniform(0.70, 0.99), DEMO_VERSION, None
+
+        try:
+            batch = ml_utils.preprocess(image_bytes)
+            started = time.perf_counter()
+            label, confidence, features = engines.predict(active.engine, batch)
+            active_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            print(f"Inference Error: {e}")
+            return 0, 0.0, active.version, None
+
+        candidate = self.candidate
+        if candidate is not None and random.random() < self.shadow_fraction:
+            # Off the request path: the patient never waits for the candidate
+            with self._shadow_lock:
+                busy = self._shadow_pending > 0
+                if not busy:
+                    self._shadow_pending += 1
+            if busy:
+                self.shadow_stats.record_dropped()
+            else:
+                self._shadow_pool.submit(self._run_shadow, candidate, batch, label, active_ms)
+
+        return label, confidence, active.version, features
+
+    def _run_shadow(self, candidate, batch, active_label, active_ms):
+        try:
+            started = time.perf_counter()
+            label, _, _ = engines.predict(candidate.engine, batch)
+            candidate_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            print(f"Shadow Inference Error ({candidate.version}): {e}")
+            self.shadow_stats.record_error()
+            return
+        finally:
+            with self._shadow_lock:
+                self._shadow_pending -= 1
+        self.shadow_stats.record(label == active_label, active_ms, candidate_ms)
+
+    # --- Manifest ---
+
+    def apply_manifest(self, manifest):
+        active = manifest.get("active")
+        if active and (self.active is None or self.active.version != active["version"]):
+            if self.candidate is not None and self.candidate.version == active["version"]:
+                self.promote()
+            elif self.status.get(active["version"]) != "loading":
+                self.load_in_background(active["version"], active["path"])
+
+        shadow = manifest.get("shadow")
+        if not shadow:
+            self.stop_shadow()
+        elif self.candidate is not None and self.candidate.version == shadow["version"]:
+            self.shadow_fraction = float(shadow.get("fraction", 0.0))
+        elif self.status.get(shadow["version"]) != "loading":
+            self.load_in_background(shadow["version"], shadow["path"], float(shadow.get("fraction", 0.0)))
+
+    def check_manifest(self):
+        try:
+            mtime = os.path.getmtime(MODEL_MANIFEST)
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        self._manifest_mtime = mtime
+        try:
+            with open(MODEL_MANIFEST) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not read model manifest {MODEL_MANIFEST}: {e}")
+            return
+        self.apply_manifest(manifest)
+
+    def write_manifest(self, manifest):
+        # Write-then-rename so polling workers never see a half-written file
+        tmp_path = f"{MODEL_MANIFEST}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, MODEL_MANIFEST)
+
+    def start_manifest_watcher(self):
+        if not MODEL_MANIFEST or self._watcher is not None:
+            return
+
+        def poll():
+            while True:
+                self.check_manifest()
+                time.sleep(MANIFEST_POLL_SECONDS)
+
+        self._watcher = threading.Thread(target=poll, name="model-manifest", daemon=True)
+        self._watcher.start()
+
+    def describe(self):
+        def info(loaded):
+            if not loaded:
+                return None
+            return {"version": loaded.version, "path": loaded.path, "engine": loaded.engine.name, "loaded_at": loaded.loaded_at}
+        return {
+            "active": info(self.active),
+            "candidate": info(self.candidate),
+            "shadow_fraction": self.shadow_fraction,
+            "shadow_stats": self.shadow_stats.summary(),
+            "status": dict(self.status),
+            "manifest": MODEL_MANIFEST,
+        }
+
+registry = ModelRegistry()
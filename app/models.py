@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boo
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
+from .storage import get_storage
 
 class User(Base):
     __tablename__ = "users"
@@ -23,6 +24,12 @@ class Prediction(Base):
     confidence = Column(Float)
     notes = Column(String, nullable=True)
     status = Column(String, default="pending") # "pending", "reviewed"
+    model_version = Column(String, nullable=True) # registry version that produced the result
     timestamp = Column(DateTime, default=datetime.utcnow)
 
     owner = relationship("User", back_populates="predictions")
+
+    @property
+    def image_url(self):
+        # image_path holds a storage key; resolve it through the active backend
+        return get_storage().url(self.image_path)
@@ -0,0 +1,117 @@
+import hmac
+import json
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from .. import models, admission
+from ..model_registry import registry, MODEL_MANIFEST
+from .pathologist import get_current_user_from_cookie
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"]
+)
+
+# Anyone can register as a pathologist, so changing the model every patient
+# is served by also needs the operator token, sent as the X-Admin-Token header.
+# Unset = model management is disabled.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Weight files may only be loaded from here (torch.load on arbitrary paths is
+# unsafe). No default: point it at a directory that holds only weight files.
+MODEL_DIR = os.getenv("MODEL_DIR")
+
+def require_pathologist(user: models.User = Depends(get_current_user_from_cookie)):
+    if user.role.lower() != "pathologist":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return user
+
+def require_admin(request: Request, user: models.User = Depends(require_pathologist)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model management is disabled (ADMIN_TOKEN is not set)")
+    supplied = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        print(f"WARNING: Rejected model management request from {user.username}: bad admin token")
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return user
+
+def resolve_model_path(path: str) -> str:
+    if not MODEL_DIR:
+        raise HTTPException(status_code=400, detail="MODEL_DIR is not set")
+    model_dir = os.path.realpath(MODEL_DIR)
+    full_path = os.path.realpath(os.path.join(model_dir, path))
+    if os.path.commonpath([full_path, model_dir]) != model_dir:
+        raise HTTPException(status_code=400, detail="Model path must be inside MODEL_DIR")
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail=f"Model file {path} not found")
+    return full_path
+
+def update_manifest(change):
+    # Multi-worker mode: edit the shared manifest and let every worker's
+    # watcher apply it, instead of changing only this worker's registry.
+    manifest = {}
+    if os.path.exists(MODEL_MANIFEST):
+        with open(MODEL_MANIFEST) as f:
+            manifest = json.load(f)
+    change(manifest)
+    registry.write_manifest(manifest)
+    registry.check_manifest()
+
+@router.get("/models")
+async def list_models(user: models.User = Depends(require_pathologist)):
+    return registry.describe()
+
+@router.post("/models/load")
+async def load_model(
+    version: str = Form(...),
+    path: str = Form(...),
+    shadow_fraction: Optional[float] = Form(None), # set to shadow instead of swapping in
+    user: models.User = Depends(require_admin)
+):
+    if shadow_fraction is not None and not 0.0 <= shadow_fraction <= 1.0:
+        raise HTTPException(status_code=400, detail="shadow_fraction must be between 0 and 1")
+    full_path = resolve_model_path(path)
+    print(f"INFO: {user.username} requested model {version} ({full_path}), shadow={shadow_fraction}")
+
+    if MODEL_MANIFEST:
+        def change(manifest):
+            entry = {"version": version, "path": full_path}
+            if shadow_fraction is None:
+                manifest["active"] = entry
+                manifest.pop("shadow", None)
+            else:
+                manifest["shadow"] = dict(entry, fraction=shadow_fraction)
+        update_manifest(change)
+    else:
+        registry.load_in_background(version, full_path, shadow_fraction)
+
+    # Loading and warm-up continue in the background; poll GET /admin/models
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"version": version, "status": "loading"})
+
+@router.post("/models/promote")
+async def promote_candidate(user: models.User = Depends(require_admin)):
+    candidate = registry.candidate
+    if candidate is None:
+        raise HTTPException(status_code=409, detail="No candidate model to promote")
+
+    if MODEL_MANIFEST:
+        def change(manifest):
+            manifest["active"] = {"version": candidate.version, "path": candidate.path}
+            manifest.pop("shadow", None)
+        update_manifest(change)
+    else:
+        registry.promote()
+    return registry.describe()
+
+@router.post("/models/shadow/stop")
+async def stop_shadow(user: models.User = Depends(require_admin)):
+    if MODEL_MANIFEST:
+        update_manifest(lambda manifest: manifest.pop("shadow", None))
+    else:
+        registry.stop_shadow()
+    return registry.describe()
+
+@router.get("/admission")
+async def admission_metrics(user: models.User = Depends(require_pathologist)):
+    # Admitted vs rejected traffic for this worker, plus inference queue state
+    return dict(admission.metrics.snapshot(), inference=admission.inference.state())
@@ -3,7 +3,8 @@ from fastapi import APIRouter, Depends, status, HTTPException, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from .. import database, models, schemas, auth
+from starlette.concurrency import run_in_threadpool
+from .. import database, models, schemas, auth, storage, embeddings
 
 router = APIRouter(
     tags=["Authentication"]
@@ -171,6 +172,10 @@ async def delete_account(
     # Delete associated data first? (Cascading usually handles this if set up, otherwise manual)
     # SQLAlchemy default is usually SET NULL or nothing unless Cascade is ON.
     # We will just delete the user, assuming simple setup.
+    store = storage.get_storage()
+    for pred in db.query(models.Prediction).filter(models.Prediction.user_id == user.id).all():
+        await store.delete(pred.image_path)
+        await run_in_threadpool(embeddings.get_index(pred.model_version).remove, pred.id)
     db.query(models.Prediction).filter(models.Prediction.user_id == user.id).delete()
     db.delete(user)
     db.commit()
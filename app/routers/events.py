@@ -0,0 +1,45 @@
+import asyncio
+import json
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from .. import database, models
+from ..events import bus
+from .pathologist import get_current_user_from_cookie
+
+router = APIRouter(
+    tags=["Events"]
+)
+
+KEEPALIVE_SECONDS = 15
+
+@router.get("/events")
+async def event_stream(
+    request: Request,
+    user: models.User = Depends(get_current_user_from_cookie),
+    db: Session = Depends(database.get_db)
+):
+    sub = bus.subscribe(user)
+    # Same session the auth dependency used; give its connection back to the
+    # pool now instead of holding it for the lifetime of the stream.
+    db.close()
+
+    async def stream():
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            bus.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # disable nginx response buffering
+    })
@@ -1,8 +1,11 @@
+from typing import Optional
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from .. import database, models, auth
+from starlette.concurrency import run_in_threadpool
+from .. import database, models, auth, embeddings
+from ..events import bus, prediction_payload
 
 router = APIRouter(
     prefix="/pathologist",
@@ -74,6 +77,67 @@ async def manage_cases(
         "predictions": predictions
     })
 
+@router.get("/cases/{prediction_id}/row", response_class=HTMLResponse)
+async def case_row(
+    request: Request,
+    prediction_id: int,
+    user: models.User = Depends(get_current_user_from_cookie),
+    db: Session = Depends(database.get_db)
+):
+    # Single table row, fetched by the cases page when an event arrives
+    # instead of reloading (and re-querying) the whole list
+    if user.role.lower() != "pathologist":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    prediction = db.query(models.Prediction).filter(models.Prediction.id == prediction_id).first()
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    return templates.TemplateResponse("_case_row.html", {"request": request, "pred": prediction})
+
+@router.get("/cases/{prediction_id}/similar")
+async def similar_cases(
+    prediction_id: int,
+    k: int = 5,
+    approximate: Optional[bool] = None, # default: IVF index if built (python -m app.embeddings <version>), else exact
+    user: models.User = Depends(get_current_user_from_cookie),
+    db: Session = Depends(database.get_db)
+):
+    if user.role.lower() != "pathologist":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    k = max(1, min(k, 50))
+
+    prediction = db.query(models.Prediction).filter(models.Prediction.id == prediction_id).first()
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    # Only cases embedded by the same model version are comparable
+    index = embeddings.get_index(prediction.model_version)
+
+    def find_matches():
+        query = index.get(prediction_id)
+        if query is None:
+            # Demo-mode prediction or uploaded before embeddings were recorded
+            return []
+        return index.search(query, k=k, exclude_id=prediction_id, approximate=approximate)
+
+    # The scan is CPU-bound NumPy over a memmap; keep it off the event loop
+    matches = await run_in_threadpool(find_matches)
+
+    # One query for all matches, then restore similarity order
+    found = {p.id: p for p in db.query(models.Prediction).filter(
+        models.Prediction.id.in_([pid for pid, _ in matches])).all()}
+    return [
+        {
+            "id": pid,
+            "similarity": round(score, 4),
+            "result_class": found[pid].result_class,
+            "confidence": found[pid].confidence,
+            "status": found[pid].status,
+            "notes": found[pid].notes,
+            "image_url": found[pid].image_url,
+            "model_version": found[pid].model_version,
+        }
+        for pid, score in matches if pid in found
+    ]
+
 @router.post("/review/{prediction_id}")
 async def review_prediction(
     prediction_id: int,
@@ -97,11 +161,12 @@ async def review_prediction(
             prediction.status = "Rejected"
         
         # Always update notes if provided
-        await db.refresh(prediction) # Ensure fresh stats? No need.
         if notes:
             prediction.notes = notes
             
         db.commit()
+        await bus.publish("review", prediction_payload(prediction),
+                          user_ids=[prediction.user_id], roles=["pathologist"])
     
     # Redirect back to Cases list
     return RedirectResponse(url="/pathologist/cases", status_code=status.HTTP_302_FOUND)
@@ -127,7 +192,7 @@ async def export_predictions_csv(
     writer = csv.writer(output)
     
     # Header
-    writer.writerow(["ID", "Date", "Patient ID", "Image Path", "Prediction", "Confidence", "Status", "Notes"])
+    writer.writerow(["ID", "Date", "Patient ID", "Image Path", "Prediction", "Confidence", "Status", "Notes", "Model Version"])
     
     # Rows
     for pred in predictions:
@@ -140,7 +205,8 @@ async def export_predictions_csv(
             pred_label,
             f"{pred.confidence:.4f}",
             pred.status,
-            pred.notes or ""
+            pred.notes or "",
+            pred.model_version or ""
         ])
         
     output.seek(0)
@@ -2,12 +2,12 @@ from fastapi import APIRouter, Depends, UploadFile, File, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
-import os
-import shutil
 from datetime import datetime
 
-from .. import database, models, schemas, auth, ml_utils
+from .. import database, models, schemas, auth, ml_utils, storage, embeddings, admission
+from ..events import bus, prediction_payload
 
 router = APIRouter(
     prefix="/patient",
@@ -57,36 +57,53 @@ async def upload_image(
     user: models.User = Depends(get_current_user_from_cookie),
     db: Session = Depends(database.get_db)
 ):
-    # Save file
-    upload_dir = "static/uploads"
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-    
-    file_location = f"{upload_dir}/{datetime.now().timestamp()}_{file.filename}"
-    
     # Read file for prediction
     contents = await file.read()
     
-    # Save to disk
-    with open(file_location, "wb") as f:
-        f.write(contents)
-        
-    # Run Inference
-    predicted_class, confidence = ml_utils.predict(contents)
+    # Published before taking a slot: a slow broker must not hold one
+    await bus.publish("upload", {"user_id": user.id}, user_ids=[user.id], roles=["pathologist"])
+    # Wait for an inference slot (503 if the queue budget runs out, before
+    # anything is stored)
+    async with admission.inference.slot("/patient/upload"):
+        # Run Inference in a worker thread so the event loop keeps serving
+        predicted_class, confidence, model_version, features = await run_in_threadpool(
+            ml_utils.predict_image, contents)
+    
+    # Save to storage backend (sharded local dir or S3)
+    image_key = await storage.get_storage().save(contents, file.filename)
     
     # Save to DB
     new_prediction = models.Prediction(
         user_id=user.id,
-        image_path=file_location,
+        image_path=image_key,
         result_class=predicted_class,
-        confidence=confidence
+        confidence=confidence,
+        model_version=model_version
     )
     db.add(new_prediction)
     db.commit()
     db.refresh(new_prediction)
+    if features is not None:
+        # Indexed by prediction id, in the index of the model that produced it
+        await run_in_threadpool(embeddings.get_index(model_version).add, new_prediction.id, features)
+    await bus.publish("inference_complete", prediction_payload(new_prediction),
+                      user_ids=[user.id], roles=["pathologist"])
     
     return RedirectResponse(url=f"/patient/result/{new_prediction.id}", status_code=status.HTTP_302_FOUND)
 
+@router.get("/cases/{prediction_id}/card", response_class=HTMLResponse)
+async def case_card(
+    request: Request,
+    prediction_id: int,
+    user: models.User = Depends(get_current_user_from_cookie),
+    db: Session = Depends(database.get_db)
+):
+    # Single history card, fetched by the dashboard when an event arrives
+    prediction = db.query(models.Prediction).filter(models.Prediction.id == prediction_id).first()
+    if not prediction or prediction.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    return templates.TemplateResponse("_patient_case.html", {"request": request, "pred": prediction})
+
 @router.get("/result/{prediction_id}", response_class=HTMLResponse)
 async def view_result(
     request: Request,
@@ -143,6 +160,7 @@ async def download_report(
                 {'POSITIVE FOR IDC' if prediction.result_class == 1 else 'NEGATIVE FOR IDC'}
             </span></p>
             <p>Confidence: <strong>{round(prediction.confidence * 100, 2)}%</strong></p>
+            <p>Model Version: {prediction.model_version or 'unknown'}</p>
             <p>Original Image: {prediction.image_path}</p>
         </div>
         
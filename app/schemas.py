@@ -28,6 +28,7 @@ class PredictionOut(PredictionBase):
     created_at: datetime
     notes: Optional[str] = None
     status: str
+    model_version: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -0,0 +1,186 @@
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    BOTO3_AVAILABLE = True
+except ImportError:
+    boto3 = None
+    BotoConfig = None
+    BOTO3_AVAILABLE = False
+
+import aiofiles
+import asyncio
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from datetime import datetime
+from urllib.parse import quote
+
+# Storage Setup
+# "local" (default) writes under static/uploads, "s3" uses any S3-compatible
+# service (AWS, MinIO, R2...). Use s3 on Vercel: local files die with the instance.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "static/uploads")
+# URL prefix local uploads are served under. Inside static/ the /static mount
+# already covers them; anywhere else (e.g. UPLOAD_DIR=/data/uploads) main.py
+# mounts UPLOAD_DIR at /uploads. Set it to a full URL if a fronting web
+# server or CDN serves the directory instead.
+_upload_rel = os.path.relpath(os.path.abspath(UPLOAD_DIR), os.path.abspath("static"))
+_UPLOAD_IN_STATIC = _upload_rel != ".." and not _upload_rel.startswith(".." + os.sep)
+UPLOAD_URL_PREFIX = (os.getenv("UPLOAD_URL_PREFIX") or (
+    posixpath.join("/static", _upload_rel.replace(os.sep, "/")) if _UPLOAD_IN_STATIC else "/uploads"
+)).rstrip("/")
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. http://127.0.0.1:9000 for MinIO
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_URL_EXPIRES = int(os.getenv("S3_URL_EXPIRES", "3600"))
+
+def make_key(contents: bytes, filename: str) -> str:
+    # Two levels of 256 shards from the content hash keeps every directory small
+    # (~15 entries each at 1M uploads) no matter how many files are stored.
+    digest = hashlib.sha256(contents).hexdigest()
+    # Keys end up in URLs: keep only characters that need no escaping
+    # ("#", "?" or "%" in a filename would otherwise break the image link)
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "")) or "upload"
+    return f"{digest[:2]}/{digest[2:4]}/{datetime.now().timestamp()}_{name}"
+
+def upload_mount():
+    # (url_path, directory) the app itself must serve, or None when the /static
+    # mount or something outside the app already serves local uploads
+    if STORAGE_BACKEND != "local" or not UPLOAD_URL_PREFIX.startswith("/"):
+        return None
+    if UPLOAD_URL_PREFIX.startswith("/static/"):
+        return None
+    return UPLOAD_URL_PREFIX, UPLOAD_DIR
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str = UPLOAD_DIR, url_prefix: str = UPLOAD_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    async def save(self, contents: bytes, filename: str) -> str:
+        key = make_key(contents, filename)
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # aiofiles runs the write in a thread so the event loop keeps serving
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(contents)
+        return key
+
+    def url(self, key: str) -> str:
+        # quote() for legacy keys, which kept the raw user filename
+        if key.startswith("static/"):
+            # Legacy flat layout: image_path was stored as the full relative path
+            return quote(f"/{key}")
+        return f"{self.url_prefix}/{quote(key)}"
+
+    async def delete(self, key: str):
+        path = key if key.startswith("static/") else os.path.join(self.root, key)
+        try:
+            await asyncio.to_thread(os.remove, path)
+        except FileNotFoundError:
+            pass
+
+class S3Storage:
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL):
+        if not BOTO3_AVAILABLE:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        # Credentials come from the usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY env vars.
+        # Path-style addressing is what MinIO and most S3 stand-ins expect.
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=S3_REGION,
+            config=BotoConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+
+    async def save(self, contents: bytes, filename: str) -> str:
+        key = make_key(contents, filename)
+        content_type = mimetypes.guess_type(filename or "")[0] or "application/octet-stream"
+        # boto3 is blocking; keep it off the event loop
+        await asyncio.to_thread(
+            self.client.put_object,
+            Bucket=self.bucket, Key=key, Body=contents, ContentType=content_type,
+        )
+        return key
+
+    def url(self, key: str) -> str:
+        if key.startswith("static/"):
+            # Row from before the switch to S3: the file was never uploaded to
+            # the bucket, so keep serving it from the /static mount (works while
+            # it is still on local disk). To migrate one, upload the file to the
+            # bucket and set image_path to the new key.
+            return quote(f"/{key}")
+        # Presigned GET: the browser fetches straight from the bucket, the app
+        # never proxies image bytes. Signing is local, no network round trip.
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=S3_URL_EXPIRES,
+        )
+
+    async def delete(self, key: str):
+        if key.startswith("static/"):
+            # Legacy local file, see url()
+            return await LocalStorage().delete(key)
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+_storage = None
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        else:
+            _storage = LocalStorage()
+        print(f"INFO: Upload storage backend: {_storage.name}")
+    return _storage
+
+def check_s3():
+    # Round trip against the configured S3-compatible endpoint:
+    #   S3_ENDPOINT_URL=http://127.0.0.1:9000 S3_BUCKET=idc-check \
+    #   AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=... python -m app.storage
+    import urllib.request
+
+    if not S3_ENDPOINT_URL:
+        print("SKIP: S3_ENDPOINT_URL is not set (point it at a local MinIO to run this check).")
+        return 0
+    store = S3Storage()
+    try:
+        store.client.head_bucket(Bucket=store.bucket)
+    except Exception:
+        store.client.create_bucket(Bucket=store.bucket)
+
+    payload = os.urandom(4096)
+    key = asyncio.run(store.save(payload, "check a b#0?.png"))
+    url = store.url(key)
+    print(f"INFO: Saved {key}, presigned URL: {url}")
+    with urllib.request.urlopen(url) as response:
+        fetched = response.read()
+        content_type = response.headers.get("Content-Type")
+    if fetched != payload:
+        print("ERROR: Presigned GET returned different bytes.")
+        return 1
+    asyncio.run(store.delete(key))
+    try:
+        store.client.head_object(Bucket=store.bucket, Key=key)
+        print("ERROR: Object still exists after delete.")
+        return 1
+    except store.client.exceptions.ClientError:
+        pass
+    print(f"SUCCESS: S3 save / presigned fetch ({content_type}) / delete round trip OK.")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(check_s3())
@@ -0,0 +1,31 @@
+# Gunicorn config for multi-worker deployments (not used on Vercel).
+#   gunicorn app.main:app -c gunicorn.conf.py
+#
+# PRELOAD_MODEL=1 loads the model in the master before forking, so workers
+# share its weight pages. Compare the per-worker "MEMORY" log lines with
+# PRELOAD_MODEL=0 / MODEL_MMAP=0 to see the difference.
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Read by app.main at import time (in the master when preloading)
+os.environ.setdefault("PRELOAD_MODEL", "1")
+preload_app = os.environ["PRELOAD_MODEL"] == "1"
+
+def post_fork(server, worker):
+    from app import database, ml_utils
+    # Importing the app in the master (create_all etc.) left SQLite connections
+    # in the pool; a connection must never be used on both sides of a fork.
+    # close=False drops them from the child's pool without touching the
+    # master's file handles.
+    database.engine.dispose(close=False)
+    ml_utils.log_memory_usage(f"worker {worker.pid} forked")
+
+def post_worker_init(worker):
+    from app import ml_utils
+    # Load (or, when preloaded, just reuse) the model before taking traffic,
+    # so the first request doesn't pay for it and the memory line below
+    # reflects the worker's steady state.
+    ml_utils.get_model()
+    ml_utils.log_memory_usage(f"worker {worker.pid} ready")